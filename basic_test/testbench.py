@@ -1,4 +1,9 @@
+import cocotb
 from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+import os
+import time
+import types
 from pyuvm import *
 import random
 import pyuvm
@@ -13,6 +18,49 @@ sys.path.append(str(Path("../..").resolve()))
 from uvm_packet import *
 from uvm_network import *
 
+class WakeupCounter:
+    """Counts the wakeups of the coroutines started by the BFM (driver,
+    monitors) and the wall time of the test. The BFM code is not changed,
+    its coroutines are wrapped when start_bfm starts them.
+    """
+    def __init__(self):
+        self.wakeups = 0
+        self.start_time = time.perf_counter()
+
+    def start_bfm(self, bfm):
+        start_soon = cocotb.start_soon
+        cocotb.start_soon = lambda coro: start_soon(self.count(coro))
+        try:
+            bfm.start_bfm()
+        finally:
+            cocotb.start_soon = start_soon
+
+    async def count(self, coro):
+        return await self.resume_counted(coro)
+
+    @types.coroutine
+    def resume_counted(self, coro):
+        (value, error) = (None, None)
+        while True:
+            try:
+                trigger = coro.send(value) if error is None else coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                (value, error) = ((yield trigger), None)
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as exc:
+                (value, error) = (None, exc)
+            self.wakeups += 1
+
+    def report(self, logger, bfm):
+        logger.info(f"{type(bfm).__name__} wakeups: {self.wakeups} "
+                    f"wall time: {time.perf_counter() - self.start_time:.3f} s "
+                    f"sim time: {get_sim_time('us')} us")
+
+
 class AluSeqItem(uvm_sequence_item):
     def __init__(self, name, aa, bb, op):
         super().__init__(name)
@@ -51,10 +99,11 @@ class Driver(uvm_driver):
     def build_phase(self):
         self.network = ConfigDB().get(None, "", "NETWORK")
         self.bfm     = ConfigDB().get(None, "", "BFM")
+        self.wakeup_counter = ConfigDB().get(None, "", "WAKEUPS")
    
     async def launch_tb(self):
         await self.bfm.reset()
-        self.bfm.start_bfm()
+        self.wakeup_counter.start_bfm(self.bfm)
     
     async def proc_driver(self, pkt :uvm_packet) -> uvm_packet:
         req_obj = pkt.get_req_obj()
@@ -121,7 +170,8 @@ class Scoreboard(uvm_component):
             self.resultcnt += 1 
 
     def check_phase(self):
-        
+        ConfigDB().get(None, "", "WAKEUPS").report(self.logger, ConfigDB().get(None, "", "BFM"))
+
         if self.cmdcnt == 0:
             uvm_error("scoreboard", " no commands were sent")
 
@@ -135,7 +185,14 @@ class AluEnv(uvm_env):
         self.network    = uvm_network("network", self)
         ConfigDB().set(None, "*", "NETWORK", self.network)
 
-        self.bfm        = TinyAluBfm()
+        ConfigDB().set(None, "*", "WAKEUPS", WakeupCounter())
+
+        #TINYALU_BFM=network selects the event driven BFM (opt-in, not measured yet)
+        if os.environ.get("TINYALU_BFM", "poll") == "network":
+            from tinyalu_network_bfm import TinyAluNetworkBfm
+            self.bfm    = TinyAluNetworkBfm()
+        else:
+            self.bfm    = TinyAluBfm()
         ConfigDB().set(None, "*", "BFM", self.bfm)
 
         self.driver     = Driver.create("driver", self)
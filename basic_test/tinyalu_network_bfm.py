@@ -0,0 +1,86 @@
+import cocotb
+from cocotb.triggers import FallingEdge, RisingEdge, ReadOnly
+
+from pyuvm import utility_classes, ConfigDB
+
+from tinyalu_utils import get_int
+
+
+class TinyAluNetworkBfm(metaclass=utility_classes.Singleton):
+    """TinyALU BFM where the driver and the monitors are uvm_network endpoints.
+    The driver only wakes up when a command is put on the network and on done,
+    the monitors only wake up on RisingEdge(start) and RisingEdge(done)
+    and read the signals of that cycle once settled (ReadOnly),
+    instead of every FallingEdge(clk) like TinyAluBfm.
+    Opt-in with TINYALU_BFM=network, TinyAluBfm stays the default.
+    """
+    def __init__(self):
+        self.dut = cocotb.top
+        self.network = ConfigDB().get(None, "", "NETWORK")
+        self.network.add_path("alu_driver", "alu_bfm")
+        self.network.add_path("alu_bfm", "cmd_mon")
+        self.network.add_path("alu_bfm", "res_mon")
+
+    async def send_op(self, aa, bb, op):
+        await self.network.put_ack("alu_driver", "alu_bfm", (aa, bb, op))
+
+    async def get_cmd(self):
+        cmd = await self.network.get("alu_bfm", "cmd_mon")
+        return cmd
+
+    async def get_result(self):
+        result = await self.network.get("alu_bfm", "res_mon")
+        return result
+
+    async def reset(self):
+        await FallingEdge(self.dut.clk)
+        self.dut.reset_n.value = 0
+        self.dut.A.value = 0
+        self.dut.B.value = 0
+        self.dut.op.value = 0
+        await FallingEdge(self.dut.clk)
+        self.dut.reset_n.value = 1
+        await FallingEdge(self.dut.clk)
+
+    async def drive_op(self, pkt):
+        (aa, bb, op) = pkt.get_req_obj()
+        await FallingEdge(self.dut.clk)
+        self.dut.A.value = aa
+        self.dut.B.value = bb
+        self.dut.op.value = op
+        self.dut.start.value = 1
+        await RisingEdge(self.dut.done)
+        await FallingEdge(self.dut.clk)
+        self.dut.start.value = 0
+        pkt.set_state_done()
+        return pkt
+
+    async def driver_bfm(self):
+        self.dut.start.value = 0
+        self.dut.A.value = 0
+        self.dut.B.value = 0
+        self.dut.op.value = 0
+        async for _ in self.network.stream("alu_driver", "alu_bfm",
+                                           self.drive_op):
+            pass
+
+    async def cmd_mon_bfm(self):
+        while True:
+            await RisingEdge(self.dut.start)
+            await ReadOnly()
+            cmd_tuple = (get_int(self.dut.A),
+                         get_int(self.dut.B),
+                         get_int(self.dut.op))
+            await self.network.put_noack("alu_bfm", "cmd_mon", cmd_tuple)
+
+    async def result_mon_bfm(self):
+        while True:
+            await RisingEdge(self.dut.done)
+            await ReadOnly()
+            result = get_int(self.dut.result)
+            await self.network.put_noack("alu_bfm", "res_mon", result)
+
+    def start_bfm(self):
+        cocotb.start_soon(self.driver_bfm())
+        cocotb.start_soon(self.cmd_mon_bfm())
+        cocotb.start_soon(self.result_mon_bfm())
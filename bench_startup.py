@@ -0,0 +1,51 @@
+"""
+import & startup benchmark of uvm network
+    python bench_startup.py [--paths 1000] [--budget 0.05]
+exits with an error if uvm_network(...) + add_path for all the paths takes longer than the budget (seconds)
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+def bench_import(module:str) -> float:
+    """time a clean import of the module in a new interpreter, pyuvm/cocotb are imported first so only the module is timed"""
+    code = (
+        "import time, pyuvm\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def bench_startup(num_paths:int) -> float:
+    """time the construction of a network and num_paths add_path calls"""
+    from pyuvm import uvm_root
+    from uvm_network import uvm_network
+
+    start   = time.perf_counter()
+    network = uvm_network("network", uvm_root())
+    for idx in range(num_paths):
+        network.add_path(f"source_{idx}", f"destination_{idx}")
+    return time.perf_counter() - start
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths" , type=int  , default=1000)
+    parser.add_argument("--budget", type=float, default=0.05)
+    args = parser.parse_args()
+
+    import_time  = bench_import("uvm_network")
+    startup_time = bench_startup(args.paths)
+
+    print(f"import uvm_network            : {import_time*1e3:8.2f} ms")
+    print(f"uvm_network + {args.paths} add_path : {startup_time*1e3:8.2f} ms (budget {args.budget*1e3:.2f} ms)")
+
+    if startup_time > args.budget:
+        print("FAILED: startup is over budget")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
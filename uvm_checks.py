@@ -0,0 +1,22 @@
+"""
+checked mode of uvm network, parameter validation is only loaded when it is turned on
+set UVM_NETWORK_CHECKED=1 in the environment to validate the parameters of every call
+"""
+import os
+
+CHECKED = os.environ.get("UVM_NETWORK_CHECKED", "0") == "1"
+
+if CHECKED:
+    from parameters_validation import validate_parameters, strongly_typed, non_blank
+else:
+    def validate_parameters(func):
+        """checked mode is off, the function is not wrapped"""
+        return func
+
+    def strongly_typed(param_type):
+        """checked mode is off, the annotation is the plain type"""
+        return param_type
+
+    def non_blank(param_type):
+        """checked mode is off, the annotation is the plain type"""
+        return param_type
@@ -1,12 +1,181 @@
 """
 uvm network where you can create network paths and send packets around
 """
+import collections
+import heapq
+import inspect
+import pickle
+import time
+import zlib
 import cocotb
 from cocotb.queue import Queue
+from cocotb.triggers import Event, First, Timer
+from cocotb.utils import get_sim_time
 from pyuvm import uvm_object, uvm_component
-from uvm_packet import TxState, TxMode, uvm_packet
-from icecream import ic
-from parameters_validation import validate_parameters,strongly_typed, non_blank
+from uvm_packet import TxState, TxMode, PayloadPolicy, CoalescePolicy, HookEvent, uvm_packet, uvm_cow_proxy, uvm_payload_codec, is_immutable, clone_payload
+from uvm_checks import validate_parameters,strongly_typed, non_blank
+
+#marker placed on a closed path queue, tells consumers no more data will arrive
+END_OF_PATH = object()
+
+#marker for a path that has not seen any data yet
+NO_DATA = object()
+
+class uvm_path_queue(Queue):
+    """
+    queue of a network path, noack packets can be coalesced at put time
+    """
+    def __init__(self, maxsize=0, coalesce=CoalescePolicy.NONE, key=None):
+        self.coalesce  = coalesce
+        self.key       = key
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.last_data = NO_DATA
+        self.key_db    = {} #key -> waiting packet
+        self.pkt_key   = {} #id(waiting packet) -> key
+        self.buffer_list = [] #buffers of the running streams, packets pulled but not yielded yet
+
+    def _get(self):
+        pkt = super()._get()
+        self.release(pkt)
+        return pkt
+
+    def track_key(self, pkt:uvm_packet) -> None:
+        """
+            the packet waits on the path (queued or in flight), it can be merged into (KEY only)
+        """
+        if (self.coalesce == CoalescePolicy.KEY) and (pkt.get_mode() == TxMode.NOACK):
+            key = self.key(pkt.get_req_obj())
+            self.key_db[key]      = pkt
+            self.pkt_key[id(pkt)] = key
+
+    def release(self, pkt) -> None:
+        """
+            the packet is not waiting anymore, so it can not be merged into
+        """
+        if id(pkt) in self.pkt_key:
+            del self.key_db[self.pkt_key.pop(id(pkt))]
+
+    def pull_nowait(self, buffer:collections.deque, batch:int) -> None:
+        """
+            move up to batch packets into a stream buffer, they are still waiting (counted, merged into)
+            until the stream releases them
+        """
+        while self._queue and (batch > 0):
+            buffer.append(self._queue.popleft())
+            batch -= 1
+
+    def pkt_count(self) -> int:
+        """
+            number of packets in the queue and the stream buffers, the end of path marker (always last) is not counted
+        """
+        count = 0
+        for buffer in self.buffer_list + [self._queue]:
+            count += len(buffer)
+            if buffer and (buffer[-1] is END_OF_PATH):
+                count -= 1
+        return count
+
+    def last_pkt(self):
+        """
+            the packet which waits last on the path (queue, then stream buffers), None if nothing waits
+        """
+        if self._queue:
+            return self._queue[-1]
+        for buffer in reversed(self.buffer_list):
+            if buffer:
+                return buffer[-1]
+        return None
+
+    def put_all_nowait(self, pkt_list:list) -> None:
+        """
+            put a list of packets into the queue in one go (restore of a snapshot)
+        """
+        for pkt in pkt_list:
+            self.track_key(pkt)
+
+        self._queue.extend(pkt_list)
+        self._finished.clear()
+        for _ in pkt_list:
+            self._wakeup_next(self._getters)
+
+    def put_front_nowait(self, pkt_list:list) -> None:
+        """
+            put a list of packets back to the front of the queue, keeping their order
+        """
+        self._queue.extendleft(reversed(pkt_list))
+        self._finished.clear()
+        for _ in pkt_list:
+            self._wakeup_next(self._getters)
+
+    def is_duplicate(self, data) -> bool:
+        """
+            check if the data is the same as the previous data (DROP_DUPLICATES only).
+            only immutable data is compared, a mutable object can be changed after it is put
+            (i.e a reused sample object) so it is never a duplicate
+        """
+        if self.coalesce != CoalescePolicy.DROP_DUPLICATES:
+            return False
+
+        if not(is_immutable(data)):
+            self.last_data = NO_DATA
+            return False
+
+        duplicate      = (self.last_data is not NO_DATA) and (data == self.last_data)
+        self.last_data = data
+        return duplicate
+
+    def coalesce_nowait(self, pkt:uvm_packet, data) -> bool:
+        """
+            merge the packet into a waiting packet (LATEST/KEY only)
+            return True if merged, the packet must not be queued then
+        """
+        if self.coalesce == CoalescePolicy.LATEST:
+            last_pkt = self.last_pkt()
+            if isinstance(last_pkt, uvm_packet) and last_pkt.get_mode() == TxMode.NOACK:
+                last_pkt.set_req_obj(pkt.get_req_obj())
+                return True
+
+        elif self.coalesce == CoalescePolicy.KEY:
+            key     = self.key(data)
+            old_pkt = self.key_db.get(key)
+            if old_pkt is not None:
+                old_pkt.set_req_obj(pkt.get_req_obj())
+                return True
+            #first packet with this key, it is queued and can be merged into later
+            self.key_db[key]       = pkt
+            self.pkt_key[id(pkt)]  = key
+
+        return False
+
+class uvm_hook_batch:
+    """
+    hook subscriber which collects events and delivers them in batches of
+    (event, path, pkt_id, state, req_obj) tuples, taken when the event fires since the packet
+    changes afterwards (state, coalesced data). a coroutine callback is started in the
+    background, a plain function is called directly
+    """
+    def __init__(self, callback, size:int):
+        self.callback = callback
+        self.size     = size
+        self.events   = []
+
+    def __call__(self, event:HookEvent, pkt:uvm_packet) -> None:
+        self.events.append((event, pkt.get_path(), pkt.get_pkt_id(), pkt.get_state(), pkt.get_req_obj()))
+        if len(self.events) >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        """deliver the events collected so far"""
+        if len(self.events) == 0:
+            return
+        (events, self.events) = (self.events, [])
+        if inspect.iscoroutinefunction(self.callback):
+            cocotb.start_soon(self.callback(events))
+        else:
+            self.callback(events)
 
 class uvm_network(uvm_component):
     """
@@ -15,8 +184,9 @@ class uvm_network(uvm_component):
     @validate_parameters
     def __init__(
         self, 
-        name   : strongly_typed(str),  # type: ignore
-        parent : strongly_typed(uvm_component)   # type: ignore
+        name      : strongly_typed(str),  # type: ignore
+        parent    : strongly_typed(uvm_component),   # type: ignore
+        time_unit : non_blank(str) = "ns" # type: ignore
     ):
         super().__init__(name, parent)
         self.name         = name
@@ -25,6 +195,34 @@ class uvm_network(uvm_component):
         self.queue_dict   = {}
         self.ack_db       = {}
         self.flush_db     = []
+        self.payload_db   = {}
+        self.frozen_db    = {}  #id(data) -> [is immutable, running broadcasts], for the data of running broadcasts
+        self.stats_db     = {}
+        self.pkt_id_db    = {}
+
+        #hook subscribers, (event, path or None for all paths) -> list of callbacks
+        self.subscriber_db = {}
+        self.hook_db       = {}  #path -> compiled callbacks per event, None if no subscribers
+
+        #blocked coroutines, wait id -> (kind, path, pkt_id, since), kind is "get" or "ack"
+        self.wait_db       = {}
+        self.proc_db       = {}  #path -> ids of ack packets being processed by the destination
+        self.wait_seq      = 0
+        self.watchdog_task = None
+
+        #profiler, (source, destination, phase) -> [wall time, sim time, count], None when off
+        self.profile_db    = None
+        self.profile_file  = None
+
+        #timing of the paths, all delayed packets share one timing wheel
+        self.time_unit    = time_unit
+        self.timing_db    = {}  #path -> (latency, interval)
+        self.next_free_db = {}  #path -> earliest time the path can deliver again
+        self.in_flight_db = {}  #path -> number of packets in the timing wheel
+        self.wheel        = []  #heap of (delivery time, seq, path, packet)
+        self.wheel_seq    = 0
+        self.wheel_event  = Event("timing_wheel")
+        self.wheel_task   = None
 
         ##########################        
         self.err_msg_path_does_not_exist        = "[ERR-1] path does not exist in this network"
@@ -34,6 +232,15 @@ class uvm_network(uvm_component):
         self.err_msg_no_available_paths         = "[ERR-5] There are no available paths"
         self.err_msg_invalid_ack_status         = "[ERR-6] invalid ack status"
         self.err_msg_invalid_ack_process        = "[ERR-7] invalid/null ack processing function"
+        self.err_msg_path_closed                = "[ERR-8] path is closed, no more data can be put"
+        self.err_msg_invalid_batch              = "[ERR-9] invalid batch size, must be >= 1"
+        self.err_msg_invalid_coalesce_key       = "[ERR-10] coalesce policy KEY needs a key function"
+        self.err_msg_invalid_timing             = "[ERR-11] invalid path timing, latency & interval must be >= 0"
+        self.err_msg_invalid_subscriber         = "[ERR-12] subscriber is not registered"
+        self.err_msg_deadlock                   = "[ERR-13] deadlock, components are waiting on each other"
+        self.err_msg_stalled_path               = "[ERR-14] path has pending packets but no progress"
+        self.err_msg_invalid_snapshot           = "[ERR-15] invalid snapshot, wrong version or codec"
+        self.err_msg_mutable_payload            = "[ERR-16] payload policy IMMUTABLE, but the data can be modified"
 
     @validate_parameters
     def log_error(
@@ -42,6 +249,7 @@ class uvm_network(uvm_component):
         err_msg   : non_blank(str), # type: ignore 
         var_dict  : strongly_typed(dict), # type: ignore 
     ):
+        from icecream import ic #only needed to format errors, so loaded here
         err_str = f"{func_name} :: {err_msg}"
         ic.configureOutput(prefix="")
         var_str = ic.format(var_dict)
@@ -74,9 +282,8 @@ class uvm_network(uvm_component):
             uvm error can be enabled/disabled optionally
         """
         path          = self.set_path(source, destination)
-        path_list_tmp = self.get_path_list()
                 
-        if path in path_list_tmp:
+        if path in self.queue_dict: #same paths as path_list, dict lookup is O(1)
             return True 
         else:
             if err_en: 
@@ -88,17 +295,43 @@ class uvm_network(uvm_component):
         self, 
         source      :non_blank(str), # type: ignore
         destination :non_blank(str), # type: ignore
+        payload     :strongly_typed(PayloadPolicy) = PayloadPolicy.SHARED, # type: ignore
+        coalesce    :strongly_typed(CoalescePolicy) = CoalescePolicy.NONE, # type: ignore
+        key = None,                  # a function here, data -> key
+        latency     :strongly_typed(int) = 0, # type: ignore
+        interval    :strongly_typed(int) = 0, # type: ignore
     )-> bool:
         """
             add a new path to the network
+            payload policy sets how the data is isolated between source and destination
+            coalesce policy sets how noack data waiting on the path is coalesced
+            latency sets the delay of each packet on the path, interval sets the minimum time
+            between two packets (i.e bandwidth of one packet per interval), both in time_unit
         """        
         path   = self.set_path(source, destination)
+
+        if (latency < 0) or (interval < 0):
+            self.log_error(self.add_path.__name__, self.err_msg_invalid_timing, locals())
+            return False
+
+        if (coalesce == CoalescePolicy.KEY) and (key == None):
+            self.log_error(self.add_path.__name__, self.err_msg_invalid_coalesce_key, locals())
+            return False
         
         #path is not already setup, so ok to add to the network
         if not(self.valid_path(source, destination, err_en=False)):
             self.path_list.append(path)
-            self.queue_dict[path] = Queue(maxsize = 0) #always infinite queue
+            self.queue_dict[path] = uvm_path_queue(0, coalesce, key) #always infinite queue
             self.ack_db.setdefault(path,{}) #init ack db
+            self.payload_db[path] = payload
+            self.stats_db[path]   = {"copies": 0, "coalesced": 0, "enqueued": 0, "dequeued": 0, "acked": 0}
+            self.pkt_id_db[path]  = 0
+            self.in_flight_db[path] = 0
+            self.proc_db[path]    = set()
+            self.compile_hooks(path)
+            if (latency > 0) or (interval > 0):
+                self.timing_db[path]    = (latency, interval)
+                self.next_free_db[path] = 0
             return True
         else:
             self.log_error(self.add_path.__name__, self.err_msg_path_duplication, locals())
@@ -158,6 +391,81 @@ class uvm_network(uvm_component):
         """
         return self.path_list
 
+    def apply_payload_policy(self, path:tuple, data):
+        """
+            isolate the data according to the payload policy of the path.
+            immutable data is never copied, every copy is counted in the path stats
+        """
+        policy = self.payload_db[path]
+
+        if policy == PayloadPolicy.SHARED:
+            return data
+
+        #broadcast validates the data once for all the destinations
+        entry  = self.frozen_db.get(id(data))
+        frozen = is_immutable(data) if (entry is None) else entry[0]
+
+        if frozen:
+            return data
+
+        if policy == PayloadPolicy.IMMUTABLE:
+            #shared as asked, but the destinations are not isolated
+            self.log_error(self.apply_payload_policy.__name__, self.err_msg_mutable_payload, {"path": path, "data": data})
+            return data
+
+        if policy == PayloadPolicy.COPY_ON_WRITE:
+            return uvm_cow_proxy(data, lambda: self.count_copy(path))
+
+        self.count_copy(path)
+        return clone_payload(data)
+
+    def freeze(self, data) -> None:
+        """
+            validate once if the data of a broadcast is immutable, the puts to each destination reuse the result
+        """
+        key = id(data)
+        if key in self.frozen_db:
+            self.frozen_db[key][1] += 1 #same data in another running broadcast
+        else:
+            self.frozen_db[key] = [is_immutable(data), 1]
+
+    def unfreeze(self, data) -> None:
+        """
+            drop the validation of the data when its broadcast is done
+        """
+        entry = self.frozen_db[id(data)]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.frozen_db[id(data)]
+
+    def count_copy(self, path:tuple) -> None:
+        """
+            count a payload copy made for the path
+        """
+        self.stats_db[path]["copies"] += 1
+
+    @validate_parameters
+    def get_stats(
+        self,
+        source      : non_blank(str), # type: ignore
+        destination : non_blank(str), # type: ignore
+    ) -> dict:
+        """
+            get the stats of the network path (i.e number of payload copies, coalesced packets)
+        """
+        path = self.set_path(source, destination)
+
+        if self.valid_path(source, destination):
+            return dict(self.stats_db[path])
+        else:
+            return None
+
+    def get_copy_count(self) -> int:
+        """
+            get the total number of payload copies made by the network
+        """
+        return sum(stats["copies"] for stats in self.stats_db.values())
+
     @validate_parameters
     async def put(
         self,
@@ -169,6 +477,7 @@ class uvm_network(uvm_component):
         """
             put the data to the network path
         """
+        start   = self.profile_now() if (self.profile_db is not None) else None
         req_pkt = uvm_packet("req_pkt")
 
         #setup the path tuple
@@ -176,11 +485,27 @@ class uvm_network(uvm_component):
 
         #check if path is already setup
         if self.valid_path(source, destination):
+            if self.is_closed(source, destination):
+                self.log_error(self.put.__name__, self.err_msg_path_closed, locals())
+                return None
+
+            queue = self.queue_dict[path]
+            noack = (mode == TxMode.NOACK)
+
+            #same as the previous data, drop it before any copy is made
+            if noack and queue.is_duplicate(data):
+                req_pkt.set_all(source, destination, -1, TxState.DONE, mode, data, None)
+                self.stats_db[path]["coalesced"] += 1
+                return req_pkt
+
+            #isolate the data as per the path payload policy
+            raw_data = data
+            data     = self.apply_payload_policy(path, data)
             #create the req packet
             req_pkt.set_all(
                 source,
                 destination, 
-                self.qsize(source, destination)+1, 
+                self.next_pkt_id(path), 
                 TxState.IDLE, 
                 mode, 
                 data, 
@@ -189,22 +514,198 @@ class uvm_network(uvm_component):
             #we have started sending request
             req_pkt.set_state_started() 
 
+            #merged into a packet already waiting on the path
+            if noack and queue.coalesce_nowait(req_pkt, raw_data):
+                req_pkt.set_state_done()
+                self.stats_db[path]["coalesced"] += 1
+                return req_pkt
+
             if req_pkt.is_ack_required():
                 #create special ack path for this request
-                self.ack_db[path][req_pkt.get_pkt_id()] = Queue(maxsize=1)
+                ack_slot = self.ack_db[path][req_pkt.get_pkt_id()] = Queue(maxsize=1)
                 #send out the request packet
-                self.queue_dict[path].put_nowait(req_pkt)            
+                self.send_pkt(path, req_pkt)
+                if start is not None:
+                    req_pkt.stamp = self.profile_add(path, "enqueue", start)
                 #get back the ack
-                return await self.ack_db[path][req_pkt.get_pkt_id()].get() 
+                wait_id = self.add_wait("ack", path, req_pkt.get_pkt_id())
+                try:
+                    ack_pkt = await ack_slot.get()
+                finally:
+                    #also done if this coroutine is killed, so no stale wait or ack slot is left
+                    #(only its own slot, the id may have been taken by a newer put after a restore)
+                    del self.wait_db[wait_id]
+                    if self.ack_db[path].get(req_pkt.get_pkt_id()) is ack_slot:
+                        del self.ack_db[path][req_pkt.get_pkt_id()]
+                if (self.profile_db is not None) and (ack_pkt.stamp is not None):
+                    self.profile_add(path, "ack", ack_pkt.stamp)
+                return ack_pkt
 
             else:
-                self.queue_dict[path].put_nowait(req_pkt)
+                self.send_pkt(path, req_pkt)
+                if start is not None:
+                    req_pkt.stamp = self.profile_add(path, "enqueue", start)
                 req_pkt.set_state_done() #no ack required
                 return req_pkt
         else:
             self.log_error(self.put.__name__, self.err_msg_path_does_not_exist, locals())
             return None
 
+    @validate_parameters
+    def subscribe(
+        self,
+        event       : strongly_typed(HookEvent), # type: ignore
+        callback,                                # a function here, callback(event, pkt)
+        source      : str = None,                # None for all the paths
+        destination : str = None,                # None for all the paths
+        batch       : strongly_typed(int) = 0,   # type: ignore
+    ):
+        """
+            subscribe a callback to a network event, for all the paths or for one path.
+            with batch > 0 the callback gets a list of (event, path, pkt_id, state, req_obj) tuples every batch events
+            return the subscriber, use it to unsubscribe
+        """
+        path = None
+        if (source != None) or (destination != None):
+            if not(self.valid_path(source, destination)):
+                return None
+            path = self.set_path(source, destination)
+
+        subscriber = uvm_hook_batch(callback, batch) if (batch > 0) else callback
+        self.subscriber_db.setdefault((event, path), []).append(subscriber)
+        self.compile_all_hooks()
+
+        return subscriber
+
+    @validate_parameters
+    def unsubscribe(
+        self,
+        event       : strongly_typed(HookEvent), # type: ignore
+        subscriber,                              # returned by subscribe
+        source      : str = None,                # None for all the paths
+        destination : str = None,                # None for all the paths
+    ) -> bool:
+        """
+            remove a subscriber from a network event, batched events not delivered yet are flushed
+        """
+        path = None if (source == None) and (destination == None) else self.set_path(source, destination)
+        subscriber_list = self.subscriber_db.get((event, path), [])
+
+        if subscriber not in subscriber_list:
+            self.log_error(self.unsubscribe.__name__, self.err_msg_invalid_subscriber, locals())
+            return False
+
+        subscriber_list.remove(subscriber)
+        if isinstance(subscriber, uvm_hook_batch):
+            subscriber.flush()
+        self.compile_all_hooks()
+
+        return True
+
+    def flush_hooks(self) -> None:
+        """
+            deliver the events held by all the batched subscribers (i.e at the end of the test)
+        """
+        for subscriber_list in self.subscriber_db.values():
+            for subscriber in subscriber_list:
+                if isinstance(subscriber, uvm_hook_batch):
+                    subscriber.flush()
+
+    def compile_hooks(self, path:tuple) -> None:
+        """
+            build the callbacks of each event for the path, None when there are no subscribers
+        """
+        hooks = [tuple(self.subscriber_db.get((event, None), []) + self.subscriber_db.get((event, path), [])) for event in HookEvent]
+
+        if any(hooks):
+            self.hook_db[path] = hooks
+        else:
+            self.hook_db[path] = None
+
+    def compile_all_hooks(self) -> None:
+        """
+            rebuild the callbacks of all the paths, done when subscribers change
+        """
+        for path in self.path_list:
+            self.compile_hooks(path)
+
+    def fire_hooks(self, path:tuple, event:HookEvent, pkt) -> None:
+        """
+            call the subscribers of the event for the path
+        """
+        hooks = self.hook_db[path]
+        if hooks is not None:
+            for callback in hooks[event.value]:
+                callback(event, pkt)
+
+    def next_pkt_id(self, path:tuple) -> int:
+        """
+            get a new packet id, unique for the path
+        """
+        self.pkt_id_db[path] += 1
+        return self.pkt_id_db[path]
+
+    def send_pkt(self, path:tuple, pkt) -> None:
+        """
+            send a packet to the path queue, straight away or through the timing wheel if the path has timing
+        """
+        self.stats_db[path]["enqueued"] += 1
+        if self.hook_db[path] is not None:
+            self.fire_hooks(path, HookEvent.ENQUEUE, pkt)
+
+        if path not in self.timing_db:
+            self.queue_dict[path].put_nowait(pkt)
+            return
+
+        (latency, interval)     = self.timing_db[path]
+        now                     = get_sim_time(self.time_unit)
+        delivery_time           = max(now + latency, self.next_free_db[path])
+        self.next_free_db[path] = delivery_time + interval
+
+        if delivery_time <= now:
+            self.queue_dict[path].put_nowait(pkt)
+            return
+
+        self.wheel_seq += 1 #keeps the order of packets with the same delivery time
+        heapq.heappush(self.wheel, (delivery_time, self.wheel_seq, path, pkt))
+        self.in_flight_db[path] += 1
+
+        #wake up the timing wheel, the new packet might be the earliest
+        self.wheel_event.set()
+        if self.wheel_task is None:
+            self.wheel_task = cocotb.start_soon(self.run_timing_wheel())
+
+    async def run_timing_wheel(self) -> None:
+        """
+            deliver the delayed packets of all the paths, one timer for the earliest packet
+        """
+        while True:
+            self.wheel_event.clear()
+
+            if len(self.wheel) == 0:
+                await self.wheel_event.wait()
+                continue
+
+            now = get_sim_time(self.time_unit)
+
+            #deliver every packet which is due
+            while self.wheel and (self.wheel[0][0] <= now):
+                (_, _, path, pkt) = heapq.heappop(self.wheel)
+                self.queue_dict[path].put_nowait(pkt)
+                if pkt is not END_OF_PATH:
+                    self.in_flight_db[path] -= 1
+
+            if self.wheel:
+                #round up, a delay shorter than the sim precision must still move sim time forward
+                await First(Timer(self.wheel[0][0] - now, self.time_unit, round_mode="ceil"), self.wheel_event.wait())
+
+    def in_flight(self, path:tuple) -> list:
+        """
+            get the packets of the path which are still in the timing wheel (scans the wheel,
+            use in_flight_db[path] for the count)
+        """
+        return [pkt for (_, _, cmp_path, pkt) in self.wheel if (cmp_path == path) and (pkt is not END_OF_PATH)]
+
     @validate_parameters
     async def put_noack(
         self, 
@@ -217,6 +718,10 @@ class uvm_network(uvm_component):
         """
         pkt = await self.put(source, destination, TxMode.NOACK, data)
 
+        #path does not exist or is closed, put has logged the error
+        if pkt is None:
+            return False
+
         return pkt.is_state_done()
 
     @validate_parameters
@@ -232,6 +737,10 @@ class uvm_network(uvm_component):
         """
         pkt = await self.put(source, destination, TxMode.ACK, data)
 
+        #path does not exist or is closed, put has logged the error
+        if pkt is None:
+            return False
+
         if pkt.is_state_done():
             return True
         else:
@@ -250,7 +759,11 @@ class uvm_network(uvm_component):
         """
         perform a put with data is required, and data is returned back
         """
-        pkt      = await self.put(source, destination, data, TxMode.ACK_WITH_DATA)
+        pkt      = await self.put(source, destination, TxMode.ACK_WITH_DATA, data)
+
+        #path does not exist or is closed, put has logged the error
+        if pkt is None:
+            return None
 
         if pkt.is_state_done():
             return pkt.get_ack_obj()
@@ -280,22 +793,235 @@ class uvm_network(uvm_component):
         #check if the path is already setup 
         if self.valid_path(source, destination):
             #pull in the uvm packet
-            req_pkt = await self.queue_dict[path].get()
-            req_obj = req_pkt.get_req_obj() 
-        
-            #no ack required
-            if req_pkt.is_ack_required():
-                if (proc_func == None):
-                    self.get(self.put_ack_data.__name__, self.err_msg_invalid_ack_process, locals())
-                else:
-                    #process the request packet
-                    ack_pkt  = await proc_func(req_pkt, *arg, **kwargs)
-                    self.ack_db[path][ack_pkt.get_pkt_id()].put_nowait(ack_pkt) #send ack
-            
-            return req_obj
+            req_pkt = await self.wait_pkt(path)
+
+            #path is closed, leave the marker for any other consumer
+            if req_pkt is END_OF_PATH:
+                self.queue_dict[path].put_nowait(END_OF_PATH)
+                return None
+
+            return await self.proc_req_pkt(path, req_pkt, proc_func, *arg, **kwargs)
         else:            
             return None
 
+    def send_ack(self, path:tuple, ack_pkt:uvm_packet) -> None:
+        """
+            send the ack back to the source, dropped if the source is not waiting anymore (i.e killed)
+        """
+        ack_slot = self.ack_db[path].get(ack_pkt.get_pkt_id())
+        if ack_slot is not None:
+            ack_slot.put_nowait(ack_pkt)
+
+    async def wait_pkt(self, path:tuple):
+        """
+            pull the next packet from the path queue, the wait is recorded if it has to block
+        """
+        queue = self.queue_dict[path]
+
+        if not(queue.empty()):
+            return queue.get_nowait()
+
+        wait_id = self.add_wait("get", path, None)
+        try:
+            return await queue.get()
+        finally:
+            del self.wait_db[wait_id]
+
+    async def proc_req_pkt(
+        self,
+        path      : tuple,
+        req_pkt   : uvm_packet,
+        proc_func = None,        # a function here
+        *arg,                    # very weak type!
+        **kwargs                 # very weak type!
+    ) -> uvm_object:
+        """
+            process a request packet pulled from a path, send the ack back if required
+            output => req_object
+        """
+        req_obj = req_pkt.get_req_obj()
+        hooks   = self.hook_db[path]
+
+        self.stats_db[path]["dequeued"] += 1
+        profile = (self.profile_db is not None) and (req_pkt.stamp is not None)
+        if profile:
+            now = self.profile_add(path, "wait", req_pkt.stamp)
+
+        if hooks is not None:
+            self.fire_hooks(path, HookEvent.DEQUEUE, req_pkt)
+
+        #no ack required
+        if req_pkt.is_ack_required():
+            if (proc_func == None):
+                self.log_error(self.proc_req_pkt.__name__, self.err_msg_invalid_ack_process, locals())
+                #abort the packet so the source is not left waiting for the ack
+                req_pkt.set_state_abort()
+                self.send_ack(path, req_pkt)
+                if hooks is not None:
+                    self.fire_hooks(path, HookEvent.ABORT, req_pkt)
+            else:
+                #process the request packet, the source waits on the destination from now
+                self.proc_db[path].add(req_pkt.get_pkt_id())
+                try:
+                    ack_pkt  = await proc_func(req_pkt, *arg, **kwargs)
+                finally:
+                    self.proc_db[path].discard(req_pkt.get_pkt_id())
+                if profile:
+                    ack_pkt.stamp = self.profile_add(path, "proc", now)
+                self.send_ack(path, ack_pkt) #send ack
+                self.stats_db[path]["acked"] += 1
+                if hooks is not None:
+                    self.fire_hooks(path, HookEvent.ABORT if ack_pkt.is_state_abort() else HookEvent.ACK, ack_pkt)
+
+        return req_obj
+
+    @validate_parameters
+    async def stream(
+        self,
+        source      : non_blank(str),           # type: ignore
+        destination : non_blank(str),           # type: ignore
+        proc_func = None,                       # a function here
+        *arg,                                   # very weak type!
+        batch       : strongly_typed(int) = 16, # type: ignore
+        **kwargs                                # very weak type!
+    ):
+        """
+            async iterator over the data of a network path, ends when the path is closed or flushed
+            the path is resolved once, packets are pulled in bulk into a buffer registered on the path
+            queue, so buffered packets are still counted, coalesced into, aborted and saved
+
+            async for data in self.network.stream("cmd_mon", "scoreboard", batch=32):
+                ...
+        """
+        path = self.set_path(source, destination)
+
+        if not(self.valid_path(source, destination)):
+            return
+
+        if batch < 1:
+            self.log_error(self.stream.__name__, self.err_msg_invalid_batch, locals())
+            return
+
+        queue  = self.queue_dict[path]
+        buffer = collections.deque()
+        queue.buffer_list.append(buffer)
+
+        try:
+            while True:
+                #wait for the first packet, then grab whatever else is already queued
+                buffer.append(await self.wait_pkt(path))
+                queue.pull_nowait(buffer, batch - 1)
+
+                #abort_pkts (flush, restore) empties the buffer while the consumer runs
+                while buffer:
+                    req_pkt = buffer.popleft()
+                    if req_pkt is END_OF_PATH:
+                        #path is closed, leave the marker for any other consumer
+                        queue.put_nowait(END_OF_PATH)
+                        return
+                    queue.release(req_pkt)
+                    yield await self.proc_req_pkt(path, req_pkt, proc_func, *arg, **kwargs)
+        finally:
+            queue.buffer_list.remove(buffer)
+            #consumer left early (break, exception, kill), packets not yielded go back to the front
+            if buffer:
+                queue.put_front_nowait(list(buffer))
+
+    @validate_parameters
+    def close_path(
+        self,
+        source      : non_blank(str), # type: ignore
+        destination : non_blank(str), # type: ignore
+    ) -> bool:
+        """
+            close the network path, no more puts are accepted.
+            data already queued can still be pulled, then get returns None and stream ends
+        """
+        path = self.set_path(source, destination)
+
+        if not(self.valid_path(source, destination)):
+            return False
+
+        if not(self.is_closed(source, destination)):
+            self.flush_db.append(path)
+            if self.in_flight_db[path] > 0:
+                #marker goes behind the packets still in the timing wheel
+                self.wheel_seq += 1
+                heapq.heappush(self.wheel, (self.next_free_db[path], self.wheel_seq, path, END_OF_PATH))
+                self.wheel_event.set()
+            else:
+                self.queue_dict[path].put_nowait(END_OF_PATH)
+
+        return True
+
+    @validate_parameters
+    def flush_path(
+        self,
+        source      : non_blank(str), # type: ignore
+        destination : non_blank(str), # type: ignore
+    ) -> bool:
+        """
+            abort all the packets queued on the network path and close it.
+            sources waiting for an ack get back the aborted packet
+        """
+        path = self.set_path(source, destination)
+
+        if not(self.valid_path(source, destination)):
+            return False
+
+        self.abort_pkts(path)
+
+        if self.is_closed(source, destination):
+            self.queue_dict[path].put_nowait(END_OF_PATH)
+
+        return self.close_path(source, destination)
+
+    def abort_pkts(self, path:tuple) -> None:
+        """
+            abort all the packets queued, in stream buffers or in flight on the path (the end of path marker is removed too).
+            sources waiting for an ack get back the aborted packet
+        """
+        queue    = self.queue_dict[path]
+        pkt_list = [pkt for (_, _, cmp_path, pkt) in self.wheel if cmp_path == path]
+
+        #take the packets of this path out of the timing wheel
+        if len(pkt_list) > 0:
+            self.wheel = [entry for entry in self.wheel if entry[2] != path]
+            heapq.heapify(self.wheel)
+            self.in_flight_db[path] = 0
+
+        #packets pulled by the streams of the path come before the queued ones
+        for buffer in queue.buffer_list:
+            pkt_list.extend(buffer)
+            buffer.clear()
+
+        while not(queue.empty()):
+            pkt_list.append(queue.get_nowait())
+
+        #nothing waits on the path anymore, so nothing can be merged into or compared with
+        queue.last_data = NO_DATA
+
+        for req_pkt in pkt_list:
+            if req_pkt is END_OF_PATH:
+                continue
+            queue.release(req_pkt)
+            req_pkt.set_state_abort()
+            if self.hook_db[path] is not None:
+                self.fire_hooks(path, HookEvent.ABORT, req_pkt)
+            if req_pkt.is_ack_required():
+                self.send_ack(path, req_pkt) #send abort back
+
+    @validate_parameters
+    def is_closed(
+        self,
+        source      : non_blank(str), # type: ignore
+        destination : non_blank(str), # type: ignore
+    ) -> bool:
+        """
+            check if the network path has been closed or flushed
+        """
+        return self.set_path(source, destination) in self.flush_db
+
     @validate_parameters          
     async def broadcast_noack(
         self, 
@@ -313,15 +1039,19 @@ class uvm_network(uvm_component):
        
         #put concurrently
         
-        for path in path_list_tmp:  
-            (source, destination) = path          
-            put_task = cocotb.start_soon(self.put_noack(source, destination, data))
-            task_list.append(put_task) 
-        
-        global_status = True 
-        for task in task_list:
-            task_status   = await task
-            global_status = global_status and task_status
+        self.freeze(data)
+        try:
+            for path in path_list_tmp:  
+                (source, destination) = path          
+                put_task = cocotb.start_soon(self.put_noack(source, destination, data))
+                task_list.append(put_task) 
+            
+            global_status = True 
+            for task in task_list:
+                task_status   = await task
+                global_status = global_status and task_status
+        finally:
+            self.unfreeze(data)
        
         return global_status
 
@@ -340,15 +1070,19 @@ class uvm_network(uvm_component):
         if len(path_list_tmp) <= 0:
             return False
 
-        for path in path_list_tmp:
-            (source, destination) = path
-            put_task       = cocotb.start_soon(self.put_ack(source, destination, data))
-            task_list.append(put_task) 
+        self.freeze(data)
+        try:
+            for path in path_list_tmp:
+                (source, destination) = path
+                put_task       = cocotb.start_soon(self.put_ack(source, destination, data))
+                task_list.append(put_task) 
 
-        global_status = True 
-        for task in task_list:
-            task_status   = await task
-            global_status = global_status and task_status
+            global_status = True 
+            for task in task_list:
+                task_status   = await task
+                global_status = global_status and task_status
+        finally:
+            self.unfreeze(data)
 
         return global_status
     
@@ -371,19 +1105,350 @@ class uvm_network(uvm_component):
         if len(path_list_tmp) <= 0:
             return False
         
-        #start sending to all the destinations concurrenlty
-        for path in path_list_tmp:
-            (source, destination) = path
-            put_task       = cocotb.start_soon(self.put_ack_data(source, destination, data))
-            task_list.append(put_task) 
+        self.freeze(data)
+        try:
+            #start sending to all the destinations concurrenlty
+            for path in path_list_tmp:
+                (source, destination) = path
+                put_task       = cocotb.start_soon(self.put_ack_data(source, destination, data))
+                task_list.append(put_task) 
 
-        #wait for ack and return a list of tuples (destination_name, ack_object)
-        for task in task_list:
-            ack_pkt = await task 
-            data_list.append((self.get_destination(ack_pkt.get_path()), ack_pkt.get_ack_obj()))
+            #wait for ack and return a list of tuples (destination_name, ack_object)
+            for ((_, destination), task) in zip(path_list_tmp, task_list):
+                ack_obj = await task 
+                data_list.append((destination, ack_obj))
+        finally:
+            self.unfreeze(data)
 
         return data_list
 
+    def add_wait(self, kind:str, path:tuple, pkt_id) -> int:
+        """
+            record a coroutine blocked on a path, return the wait id
+        """
+        self.wait_seq += 1
+        self.wait_db[self.wait_seq] = (kind, path, pkt_id, get_sim_time(self.time_unit))
+        return self.wait_seq
+
+    def get_wait_table(self) -> list[tuple]:
+        """
+            get the blocked coroutines, list of (kind, path, pkt_id, since)
+            kind "get" is waiting for a packet, kind "ack" is waiting for the ack of pkt_id
+        """
+        return sorted(self.wait_db.values(), key=lambda wait: wait[3])
+
+    def get_wait_graph(self) -> dict:
+        """
+            get the wait-for graph, component -> set of components it is waiting on
+            a destination in get waits on the source. a source in put_ack waits on the destination
+            only once the destination is processing the packet, while the packet is queued or in
+            flight the source is just waiting for the network to deliver it
+        """
+        graph = {}
+        for (kind, path, pkt_id, _) in self.wait_db.values():
+            (source, destination) = path
+            if kind == "get":
+                graph.setdefault(destination, set()).add(source)
+            elif pkt_id in self.proc_db[path]:
+                graph.setdefault(source, set()).add(destination)
+        return graph
+
+    def is_deadlock(self, cycle:list) -> bool:
+        """
+            check if a cycle of the wait-for graph is a deadlock. components which only wait in get
+            on idle paths are just idle (i.e peers serving each other when the traffic stops), so the
+            cycle needs an ack edge or a path with packets queued, in flight or waiting for an ack
+        """
+        ack_path_list = [path for (kind, path, pkt_id, _) in self.wait_db.values() if (kind == "ack") and (pkt_id in self.proc_db[path])]
+
+        for (idx, component) in enumerate(cycle):
+            #component waits on the next one
+            waited = cycle[(idx + 1) % len(cycle)]
+            if (component, waited) in ack_path_list:
+                return True
+            for path in ((component, waited), (waited, component)):
+                if (path in self.queue_dict) and self.is_busy(path):
+                    return True
+        return False
+
+    def find_wait_cycle(self) -> list:
+        """
+            find a deadlock cycle in the wait-for graph, return the components in the cycle (empty if none)
+        """
+        graph = self.get_wait_graph()
+        state = {} #component -> 1 visiting, 2 done
+
+        for start in graph:
+            if start in state:
+                continue
+            stack = [(start, iter(graph.get(start, ())))]
+            trail = [start]
+            state[start] = 1
+            while stack:
+                (node, children) = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    state[node] = 2
+                    stack.pop()
+                    trail.pop()
+                elif state.get(child) == 1:
+                    cycle = trail[trail.index(child):]
+                    if self.is_deadlock(cycle):
+                        return cycle
+                elif child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(graph.get(child, ()))))
+                    trail.append(child)
+        return []
+
+    def is_busy(self, path:tuple) -> bool:
+        """
+            check if the path has packets queued, in flight or waiting for an ack
+        """
+        return (self.queue_dict[path].pkt_count() > 0) or (len(self.ack_db[path]) > 0) or (self.in_flight_db[path] > 0)
+
+    @validate_parameters
+    def start_watchdog(
+        self,
+        period        : strongly_typed(int),      # type: ignore
+        stall_periods : strongly_typed(int) = 10, # type: ignore
+    ):
+        """
+            start a sim time watchdog which checks the network every period (time_unit)
+            it reports a deadlock (cycle in the wait-for graph) and the paths with pending
+            packets but no progress for stall_periods, with the table of blocked coroutines
+        """
+        if self.watchdog_task is None:
+            self.watchdog_task = cocotb.start_soon(self.run_watchdog(period, stall_periods))
+        return self.watchdog_task
+
+    def stop_watchdog(self) -> None:
+        """
+            stop the watchdog
+        """
+        if self.watchdog_task is not None:
+            self.watchdog_task.kill()
+            self.watchdog_task = None
+
+    async def run_watchdog(self, period:int, stall_periods:int) -> None:
+        """
+            watchdog loop, see start_watchdog
+        """
+        progress_db = {}
+        idle_db     = {}
+        last_cycle  = []
+
+        while True:
+            await Timer(period, self.time_unit)
+
+            cycle = self.find_wait_cycle()
+            if cycle and (set(cycle) != set(last_cycle)):
+                self.log_error(self.run_watchdog.__name__, self.err_msg_deadlock, {"cycle": cycle, "wait_table": self.get_wait_table()})
+            last_cycle = cycle
+
+            for path in self.path_list:
+                stats    = self.stats_db[path]
+                progress = stats["dequeued"] + stats["acked"]
+
+                if self.is_busy(path) and (progress == progress_db.get(path)):
+                    idle_db[path] = idle_db.get(path, 0) + 1
+                else:
+                    idle_db[path] = 0
+                progress_db[path] = progress
+
+                #report once when the path becomes stalled
+                if idle_db[path] == stall_periods:
+                    wait_table = [wait for wait in self.get_wait_table() if wait[1] == path]
+                    self.log_error(self.run_watchdog.__name__, self.err_msg_stalled_path, {"path": path, "qsize": self.queue_dict[path].pkt_count(), "pending_acks": list(self.ack_db[path]), "wait_table": wait_table})
+
+    def encode_pkt(self, pkt:uvm_packet, codec:uvm_payload_codec) -> tuple:
+        """
+            turn a packet into a tuple for the snapshot
+        """
+        req_obj = pkt.get_req_obj()
+        if isinstance(req_obj, uvm_cow_proxy):
+            req_obj = req_obj.unwrap()
+        return (pkt.get_pkt_id(), pkt.get_state().value, pkt.get_mode().value, codec.encode(req_obj), codec.encode(pkt.get_ack_obj()))
+
+    def decode_pkt(self, path:tuple, pkt_tuple:tuple, codec:uvm_payload_codec) -> uvm_packet:
+        """
+            turn a snapshot tuple back into a packet
+        """
+        (pkt_id, state, mode, req_blob, ack_blob) = pkt_tuple
+        (source, destination) = path
+
+        pkt = uvm_packet("req_pkt")
+        pkt.set_all(source, destination, pkt_id, TxState(state), TxMode(mode), codec.decode(req_blob), codec.decode(ack_blob))
+        return pkt
+
+    def snapshot(self, codec:uvm_payload_codec = None) -> bytes:
+        """
+            save the state of the network: paths, queued & in flight packets, pending acks, packet ids and stats.
+            the packet data is encoded with the codec (pickle by default), the result is compressed bytes.
+            coroutines waiting on the network and hook subscribers are not saved
+        """
+        codec = uvm_payload_codec() if (codec == None) else codec
+        now   = get_sim_time(self.time_unit) if self.wheel else 0
+
+        path_state_list = []
+        for path in self.path_list:
+            queue                 = self.queue_dict[path]
+            (latency, interval)   = self.timing_db.get(path, (0, 0))
+            queued_list           = [self.encode_pkt(pkt, codec) for buffer in queue.buffer_list + [queue._queue] for pkt in buffer if pkt is not END_OF_PATH]
+            in_flight_list        = [(delivery_time - now, self.encode_pkt(pkt, codec)) for (delivery_time, _, cmp_path, pkt) in sorted(self.wheel) if (cmp_path == path) and (pkt is not END_OF_PATH)]
+
+            path_state_list.append((
+                path,
+                self.payload_db[path].value,
+                queue.coalesce.value,
+                latency,
+                interval,
+                path in self.flush_db,
+                self.pkt_id_db[path],
+                dict(self.stats_db[path]),
+                queued_list,
+                in_flight_list,
+                list(self.ack_db[path]),
+            ))
+
+        state = {"version": 1, "codec": codec.name, "time_unit": self.time_unit, "paths": path_state_list}
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    def restore(self, blob:bytes, codec:uvm_payload_codec = None) -> bool:
+        """
+            restore the network from a snapshot, queues are filled in bulk (not replayed puts).
+            paths missing from the network are added, existing paths keep their policies.
+            the snapshot is checked and decoded before anything is changed, so a failed restore
+            leaves the network as it was. packets on the restored paths are aborted first.
+            sources waiting for acks are not restored, acks of restored packets are dropped
+        """
+        codec = uvm_payload_codec() if (codec == None) else codec
+        state = pickle.loads(zlib.decompress(blob))
+
+        if (state.get("version") != 1) or (state.get("codec") != codec.name):
+            self.log_error(self.restore.__name__, self.err_msg_invalid_snapshot, {"version": state.get("version"), "codec": state.get("codec")})
+            return False
+
+        #check & decode everything first
+        path_state_list = []
+        for (path, payload, coalesce, latency, interval, closed, pkt_id, stats, queued_list, in_flight_list, _) in state["paths"]:
+            (source, destination) = path
+
+            if not(self.valid_path(source, destination, err_en=False)):
+                if CoalescePolicy(coalesce) == CoalescePolicy.KEY:
+                    self.log_error(self.restore.__name__, self.err_msg_invalid_coalesce_key, {"path": path})
+                    return False
+
+            pkt_list       = [self.decode_pkt(path, pkt_tuple, codec) for pkt_tuple in queued_list]
+            in_flight_list = [(delay, self.decode_pkt(path, pkt_tuple, codec)) for (delay, pkt_tuple) in in_flight_list]
+            path_state_list.append((path, payload, coalesce, latency, interval, closed, pkt_id, stats, pkt_list, in_flight_list))
+
+        now = get_sim_time(self.time_unit) if any(path_state[9] for path_state in path_state_list) else 0
+
+        for (path, payload, coalesce, latency, interval, closed, pkt_id, stats, pkt_list, in_flight_list) in path_state_list:
+            (source, destination) = path
+
+            if not(self.valid_path(source, destination, err_en=False)):
+                self.add_path(source, destination, PayloadPolicy(payload), CoalescePolicy(coalesce), None, latency, interval)
+
+            #drop what is on the path now
+            self.abort_pkts(path)
+            if path in self.flush_db:
+                self.flush_db.remove(path)
+            if path in self.timing_db:
+                self.next_free_db[path] = 0
+
+            #never go back, the ids of sources still waiting for acks must stay unique
+            self.pkt_id_db[path] = max(self.pkt_id_db[path], pkt_id)
+            self.stats_db[path]  = dict(stats)
+
+            self.queue_dict[path].put_all_nowait(pkt_list)
+
+            (_, path_interval) = self.timing_db.get(path, (0, 0))
+            for (delay, pkt) in in_flight_list:
+                self.queue_dict[path].track_key(pkt)
+                self.wheel_seq += 1
+                heapq.heappush(self.wheel, (now + delay, self.wheel_seq, path, pkt))
+                self.in_flight_db[path] += 1
+                self.next_free_db[path] = max(self.next_free_db.get(path, 0), now + delay + path_interval)
+
+            if closed:
+                self.close_path(source, destination)
+
+        if self.wheel:
+            self.wheel_event.set()
+            if self.wheel_task is None:
+                self.wheel_task = cocotb.start_soon(self.run_timing_wheel())
+
+        return True
+
+    @validate_parameters
+    def enable_profiler(
+        self,
+        profile_file : str = None, # written at the report phase if given
+    ) -> None:
+        """
+            start attributing wall clock and sim time to (source, destination, phase),
+            phases are enqueue, wait (in the queue), proc (proc_func) and ack (ack return)
+        """
+        self.profile_db   = {}
+        self.profile_file = profile_file
+
+    def disable_profiler(self) -> None:
+        """
+            stop the profiler, the times collected so far are dropped
+        """
+        self.profile_db = None
+
+    def profile_now(self) -> tuple:
+        """
+            get the (wall time, sim time) now
+        """
+        return (time.perf_counter(), get_sim_time(self.time_unit))
+
+    def profile_add(self, path:tuple, phase:str, start:tuple) -> tuple:
+        """
+            add the time since start to the phase of the path, return the (wall time, sim time) now
+        """
+        now   = self.profile_now()
+        entry = self.profile_db.get((path[0], path[1], phase))
+        if entry is None:
+            entry = self.profile_db[(path[0], path[1], phase)] = [0.0, 0.0, 0]
+        entry[0] += now[0] - start[0]
+        entry[1] += now[1] - start[1]
+        entry[2] += 1
+        return now
+
+    def get_profile(self) -> dict:
+        """
+            get the profile, (source, destination, phase) -> (wall time in s, sim time in time_unit, count)
+        """
+        if self.profile_db is None:
+            return {}
+        return {key: tuple(entry) for (key, entry) in self.profile_db.items()}
+
+    def collapsed_stacks(self, metric:str = "wall") -> str:
+        """
+            get the profile as collapsed stacks for flame graph tools (i.e flamegraph.pl, speedscope),
+            metric "wall" gives microseconds, "sim" gives sim time in time_unit
+        """
+        idx   = 0 if (metric == "wall") else 1
+        scale = 1e6 if (metric == "wall") else 1
+        lines = []
+        for ((source, destination, phase), entry) in sorted(self.get_profile().items()):
+            lines.append(f"{self.get_full_name()};{source};{destination};{phase} {round(entry[idx] * scale)}")
+        return "\n".join(lines) + "\n"
+
+    def report_phase(self):
+        """
+            write the profile at the end of the test, wall time to profile_file and sim time to profile_file.sim
+        """
+        if (self.profile_db is not None) and (self.profile_file is not None):
+            with open(self.profile_file, "w") as profile_fh:
+                profile_fh.write(self.collapsed_stacks("wall"))
+            with open(self.profile_file + ".sim", "w") as profile_fh:
+                profile_fh.write(self.collapsed_stacks("sim"))
+
     @validate_parameters    
     def empty(
         self, 
@@ -396,7 +1461,7 @@ class uvm_network(uvm_component):
         path = self.set_path(source, destination)
 
         if self.valid_path(source, destination):
-            return self.queue_dict[path].empty()
+            return self.qsize(source, destination) == 0
         else:
             return None
 
@@ -412,7 +1477,8 @@ class uvm_network(uvm_component):
         path  = self.set_path(source, destination)
         
         if self.valid_path(source, destination):
-            return self.queue_dict[path].qsize()
+            #do not count the end of path marker
+            return self.queue_dict[path].pkt_count()
         else:
             return None
 
@@ -1,7 +1,9 @@
 """uvm packet"""
+import copy
+import pickle
 from enum import Enum
 from pyuvm import uvm_object
-from parameters_validation import validate_parameters,strongly_typed, non_blank
+from uvm_checks import validate_parameters,strongly_typed, non_blank
 
 class TxState(Enum):
     """transaction state of uvm_packet"""
@@ -16,6 +18,143 @@ class TxMode(Enum):
     ACK           = 1
     ACK_WITH_DATA = 2
 
+class PayloadPolicy(Enum):
+    """how the data of a packet is isolated between the source and destinations"""
+    SHARED        = 0 #same object to every destination, no isolation (default)
+    IMMUTABLE     = 1 #same object, checked once to be immutable, an error is logged otherwise
+    COPY_ON_WRITE = 2 #each destination gets a proxy, copied on the first write
+    CLONE         = 3 #each destination gets its own clone
+
+class CoalescePolicy(Enum):
+    """how noack packets waiting on a path are coalesced at put time"""
+    NONE            = 0 #every packet is queued (default)
+    LATEST          = 1 #mailbox, only the latest data waits on the path
+    KEY             = 2 #data with the same key replaces the waiting data
+    DROP_DUPLICATES = 3 #data equal to the previous data is dropped
+
+class HookEvent(Enum):
+    """network events which can be subscribed to"""
+    ENQUEUE = 0 #packet put on a path
+    DEQUEUE = 1 #packet pulled from a path
+    ACK     = 2 #ack sent back to the source
+    ABORT   = 3 #packet aborted (flush, or ack with abort state)
+
+IMMUTABLE_TYPES = (int, float, complex, bool, str, bytes, range, type(None), Enum)
+
+def is_immutable(data) -> bool:
+    """check if the data (and everything inside it) can not be modified"""
+    if isinstance(data, IMMUTABLE_TYPES):
+        return True
+    if isinstance(data, (tuple, frozenset)):
+        return all(is_immutable(item) for item in data)
+    return False
+
+def clone_payload(data):
+    """return a copy of the data.
+    uvm objects are copied with clone only if their class overrides do_copy, clone builds the
+    copy with cls(name) and copies only what do_copy copies. everything else is deep copied
+    """
+    if isinstance(data, uvm_object) and (type(data).do_copy is not uvm_object.do_copy):
+        return data.clone()
+    return copy.deepcopy(data)
+
+class uvm_payload_codec:
+    """codec for the packet data in a network snapshot, default is pickle.
+    override encode/decode for payloads which can not be pickled (i.e hold cocotb handles)
+    """
+    name = "pickle"
+
+    def encode(self, data) -> bytes:
+        """turn the data into bytes"""
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, blob:bytes):
+        """turn the bytes back into data"""
+        return pickle.loads(blob)
+
+class uvm_cow_proxy:
+    """copy on write proxy around a shared payload.
+    reads of immutable values (i.e int fields) go to the shared object. anything which could
+    change it makes a private clone first: attribute/item writes, method calls and reads of
+    mutable values (the proxy can not tell what is done with them afterwards).
+    isinstance(proxy, PayloadType) is True, type(proxy) is uvm_cow_proxy
+    """
+    __slots__ = ("_target", "_owned", "_on_copy")
+
+    def __init__(self, target, on_copy=None):
+        object.__setattr__(self, "_target" , target)
+        object.__setattr__(self, "_owned"  , False)
+        object.__setattr__(self, "_on_copy", on_copy)
+
+    def _own(self):
+        """make a private clone of the target before the first write"""
+        if not(self._owned):
+            object.__setattr__(self, "_target", clone_payload(self._target))
+            object.__setattr__(self, "_owned" , True)
+            if self._on_copy is not None:
+                self._on_copy()
+        return self._target
+
+    def unwrap(self):
+        """return the object behind the proxy"""
+        return self._target
+
+    @property
+    def __class__(self):
+        return type(self._target)
+
+    def _read(self, value, fetch):
+        """return an immutable value as is, fetch a mutable one again from the private clone"""
+        if is_immutable(value):
+            return value
+        return fetch(self._own())
+
+    def __getattr__(self, name):
+        return self._read(getattr(self._target, name), lambda target: getattr(target, name))
+
+    def __setattr__(self, name, value):
+        setattr(self._own(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._own(), name)
+
+    def __getitem__(self, key):
+        return self._read(self._target[key], lambda target: target[key])
+
+    def __setitem__(self, key, value):
+        self._own()[key] = value
+
+    def __delitem__(self, key):
+        del self._own()[key]
+
+    def __iter__(self):
+        if is_immutable(tuple(self._target)):
+            return iter(self._target)
+        return iter(self._own())
+
+    def __len__(self):
+        return len(self._target)
+
+    def __bool__(self):
+        return bool(self._target)
+
+    def __contains__(self, item):
+        return item in self._target
+
+    def __eq__(self, other):
+        if isinstance(other, uvm_cow_proxy):
+            other = other.unwrap()
+        return self._target == other
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __str__(self):
+        return str(self._target)
+
+    def __repr__(self):
+        return f"uvm_cow_proxy({self._target!r})"
+
 class uvm_packet(uvm_object):
     """uvm packet class"""
     @validate_parameters
@@ -32,6 +171,7 @@ class uvm_packet(uvm_object):
         self.mode    = TxMode.NOACK
         self.req_obj = uvm_object("req_obj")
         self.ack_obj = uvm_object("ack_obj")
+        self.stamp   = None #(wall time, sim time) set by the network profiler
 
     #convenience function to set all vars
     @validate_parameters
@@ -151,7 +291,7 @@ class uvm_packet(uvm_object):
         return self.mode
     
     def is_ack_required(self) -> bool:
-        if (self.get_mode() == TxMode.ACK) or (self.get_mode() == TxMode.ACK):
+        if (self.get_mode() == TxMode.ACK) or (self.get_mode() == TxMode.ACK_WITH_DATA):
             return True 
         else:
             return False